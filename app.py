@@ -1,8 +1,9 @@
+import io
 import os
 import json
 import streamlit as st
 import pandas as pd
-from src.agent.graph import run_agent
+from src.agent.graph import expand_log, stream_agent
 from src.core.cleaning import clean_dataframe
 from src.core.query import plan_query_with_llm, execute_query, summarize_results_with_llm
 from src.core.security import basic_injection_check
@@ -21,6 +22,21 @@ with st.sidebar:
     st.divider()
     st.markdown("**Tip:** Clean the data first, then ask questions.")
 
+@st.cache_data(show_spinner=False)
+def _read_csv(data: bytes) -> pd.DataFrame:
+    # keyed on the upload bytes, so widget reruns don't re-parse the file
+    try:
+        return pd.read_csv(io.BytesIO(data), engine="pyarrow", dtype_backend="pyarrow")
+    except Exception:
+        # pyarrow's parser is stricter (e.g. ragged rows); fall back to the C engine
+        return pd.read_csv(io.BytesIO(data))
+
+
+@st.cache_data(show_spinner=False)
+def _cached_clean(data: bytes):
+    return clean_dataframe(_read_csv(data))
+
+
 if "df_raw" not in st.session_state:
     st.session_state.df_raw = None
 if "df_clean" not in st.session_state:
@@ -36,13 +52,13 @@ with tab1:
     if uploaded is None:
         st.info("Upload a CSV from the sidebar.")
     else:
-        df = pd.read_csv(uploaded)
+        df = _read_csv(uploaded.getvalue())
         st.session_state.df_raw = df
         st.write("Raw preview")
         st.dataframe(df.head(20), use_container_width=True)
 
         if st.button("Clean & normalize", type="primary"):
-            dfc, report = clean_dataframe(df)
+            dfc, report = _cached_clean(uploaded.getvalue())
             st.session_state.df_clean = dfc
             st.session_state.clean_report = report
 
@@ -80,11 +96,13 @@ with tab2:
                     st.error(msg)
                 else:
                     try:
-                        spec = plan_query_with_llm(question, st.session_state.df_clean, api_key=api_key, model=model)
+                        df_clean = st.session_state.df_clean
+                        # plan_query_with_llm caches plans per dataset fingerprint + question itself
+                        spec = plan_query_with_llm(question.strip(), df_clean, api_key=api_key, model=model)
                         if show_plan:
                             st.code(spec.model_dump_json(indent=2), language="json")
 
-                        result = execute_query(spec, st.session_state.df_clean)
+                        result = execute_query(spec, df_clean)
 
                         st.write("Result table")
                         st.dataframe(result, use_container_width=True)
@@ -99,7 +117,6 @@ with tab2:
         st.divider()
         st.markdown("### Why this is accurate")
         st.markdown("- LLM only creates a small JSON query plan.\n- Pandas executes it deterministically.\n- LLM only summarizes already computed results.")
-from src.agent.graph import run_agent
 import pandas as pd
 
 with tab3:
@@ -145,8 +162,16 @@ with tab3:
             st.error("Paste some messy data first.")
             st.stop()
 
-        with st.spinner("Running extract → validate → correct loop..."):
-            final_state = run_agent(raw, api_key=api_key, model=model, max_attempts=max_attempts)
+        final_state = {}
+        with st.status("Running extract → validate → correct loop...", expanded=True) as status:
+            seen = 0
+            for _, final_state in stream_agent(raw, api_key=api_key, model=model, max_attempts=max_attempts):
+                for entry in final_state.get("log", [])[seen:]:
+                    detail = entry.get("status") or entry.get("cache") or ""
+                    st.write(f"attempt {entry.get('attempt')} · {entry.get('step')} {detail}".rstrip())
+                seen = len(final_state.get("log", []))
+            ok = final_state.get("result") is not None
+            status.update(label="Agent finished" if ok else "Agent stopped at retry limit", state="complete" if ok else "error")
 
         log = final_state.get("log", [])
         result = final_state.get("result")
@@ -193,7 +218,7 @@ with tab3:
 
         # --- Correction Log (keep your existing) ---
         st.markdown("### 🧾 Correction Log")
-        st.json(log)
+        st.json(expand_log(final_state))
 
         # If failed, stop here
         if result is None:
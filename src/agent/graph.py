@@ -1,29 +1,20 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
 import json
-import math
-from typing import Any, Dict, List, Optional, TypedDict
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple, TypedDict, get_args
 
 from langgraph.graph import StateGraph, END
 from pydantic import ValidationError
 
-from src.agent.schemas import ExtractedData
-
-
-# ---------- JSON safety ----------
-def _json_safe(obj):
-    """Recursively convert NaN/inf to None so payload becomes valid JSON."""
-    if obj is None:
-        return None
-    if isinstance(obj, float):
-        if math.isnan(obj) or math.isinf(obj):
-            return None
-        return obj
-    if isinstance(obj, dict):
-        return {k: _json_safe(v) for k, v in obj.items()}
-    if isinstance(obj, list):
-        return [_json_safe(v) for v in obj]
-    return obj
+from src.agent.llm_cache import cache_key, get_llm_cache
+from src.agent.schemas import EXTRACTED_ADAPTER, Department
+from src.agent.templates import apply_template, fingerprint, learn_template
+from src.core.cleaning import DEPT_CANON, _canon_from_map
 
 
 # ---------- OpenAI helper ----------
@@ -34,6 +25,69 @@ def _openai_client(api_key: str):
     return OpenAI(api_key=api_key, timeout=60, max_retries=5)
 
 
+def _async_openai_client(api_key: str):
+    from openai import AsyncOpenAI
+
+    # SDK retries already back off exponentially and honour retry-after on 429s
+    return AsyncOpenAI(api_key=api_key, timeout=60, max_retries=5)
+
+
+def _response_request(model: str, system: str, user: str, max_output_tokens: int) -> Dict[str, Any]:
+    return {
+        "model": model,
+        "input": [
+            {"role": "system", "content": system},
+            {"role": "user", "content": user},
+        ],
+        "temperature": 0,
+        "max_output_tokens": max_output_tokens,
+        # server-side JSON mode: no markdown fences or prose around the object
+        "text": {"format": {"type": "json_object"}},
+    }
+
+
+def _is_json(text: str) -> bool:
+    """Only parseable responses are cached; empty/truncated output must stay retryable."""
+    try:
+        json.loads(text)
+    except ValueError:
+        return False
+    return True
+
+
+def _cached_llm_call(client, model: str, system: str, user: str, max_output_tokens: int) -> Tuple[str, bool]:
+    """Return (output_text, cache_hit). temperature=0 keeps cached answers faithful."""
+    cache = get_llm_cache()
+    key = cache_key(model, system, user, max_output_tokens=max_output_tokens, text_format="json_object")
+    hit = cache.get(key)
+    if hit is not None:
+        return hit, True
+
+    resp = client.responses.create(**_response_request(model, system, user, max_output_tokens))
+    out = resp.output_text or ""
+    if _is_json(out):
+        cache.set(key, out)
+    return out, False
+
+
+async def _acached_llm_call(
+    client, sem: asyncio.Semaphore, model: str, system: str, user: str, max_output_tokens: int
+) -> Tuple[str, bool]:
+    """Async twin of _cached_llm_call; the semaphore bounds in-flight OpenAI requests."""
+    cache = get_llm_cache()
+    key = cache_key(model, system, user, max_output_tokens=max_output_tokens, text_format="json_object")
+    hit = cache.get(key)
+    if hit is not None:
+        return hit, True
+
+    async with sem:
+        resp = await client.responses.create(**_response_request(model, system, user, max_output_tokens))
+    out = resp.output_text or ""
+    if _is_json(out):
+        cache.set(key, out)
+    return out, False
+
+
 EXTRACT_SYSTEM = """You are a data extraction + validation agent.
 
 Your job: convert messy text into STRICT JSON that matches this schema:
@@ -82,9 +136,9 @@ Normalization rules:
 
 CORRECT_SYSTEM = """You are a self-correcting data validation agent.
 
-You will be given:
-- the previous JSON you produced
-- a validation error message describing why it failed
+You will be given two sections:
+- PREV_JSON: the previous JSON you produced
+- VALIDATION_ERROR: a validation error message describing why it failed
 
 Fix the JSON to satisfy the schema.
 
@@ -101,80 +155,362 @@ Rules:
 """
 
 
+# Static system prompts go first so OpenAI's prefix cache can reuse them; the
+# hashes are logged so any prompt drift (and cache invalidation) is visible.
+EXTRACT_PROMPT_HASH = hashlib.sha256(EXTRACT_SYSTEM.encode("utf-8")).hexdigest()[:12]
+CORRECT_PROMPT_HASH = hashlib.sha256(CORRECT_SYSTEM.encode("utf-8")).hexdigest()[:12]
+
+
 # ---------- LangGraph State ----------
 class AgentState(TypedDict):
     raw_text: str
+    model: str
     attempt: int
     max_attempts: int
     last_json_text: str
     validation_error: str
     result: Optional[Dict[str, Any]]
     log: List[Dict[str, Any]]
+    # full LLM outputs / validation errors, stored once; log entries point here by index
+    outputs: List[str]
+
+
+def _store_output(state: AgentState, text: str) -> int:
+    state["outputs"].append(text)
+    return len(state["outputs"]) - 1
+
+
+def expand_log(state: Dict[str, Any], max_chars: int = 2000) -> List[Dict[str, Any]]:
+    """Log entries with their referenced output/error text inlined (truncated), for display."""
+    outputs = state.get("outputs", [])
+    expanded = []
+    for entry in state.get("log", []):
+        e = dict(entry)
+        if "output_ref" in e:
+            e["output"] = outputs[e.pop("output_ref")][:max_chars]
+        if "error_ref" in e:
+            e["error"] = outputs[e.pop("error_ref")][:max_chars]
+        expanded.append(e)
+    return expanded
+
+
+# ---------- Record splitting ----------
+_BLANK_LINES_RE = re.compile(r"\n\s*\n")
+_ID_LINE_RE = re.compile(r"^[ \t]*id\s*(?::|=>?)", re.IGNORECASE | re.MULTILINE)
+
+# Floors for max_output_tokens; _output_budget raises them with the size of the input,
+# since one employee object alone is ~60-70 tokens of JSON, and caps them at what the
+# model can emit at all (asking for more is a 400, not a truncation).
+SINGLE_EXTRACT_MAX_TOKENS = 800
+RECORD_EXTRACT_MAX_TOKENS = 400
+CORRECT_MAX_TOKENS = 1400
+PER_RECORD_MAX_TOKENS = 150
+MODEL_MAX_OUTPUT_TOKENS = {
+    "gpt-4o": 16384,
+    "gpt-4o-mini": 16384,
+    "gpt-4.1": 32768,
+    "gpt-4.1-mini": 32768,
+    "gpt-4.1-nano": 32768,
+}
+DEFAULT_MAX_OUTPUT_TOKENS = 16384
+
+
+def _model_output_cap(model: str) -> int:
+    # longest prefix wins, so dated snapshots ("gpt-4o-mini-2024-07-18") map to their family
+    for name in sorted(MODEL_MAX_OUTPUT_TOKENS, key=len, reverse=True):
+        if model.startswith(name):
+            return MODEL_MAX_OUTPUT_TOKENS[name]
+    return DEFAULT_MAX_OUTPUT_TOKENS
+
+
+def _output_budget(text: str, floor: int, model: str) -> int:
+    """
+    Output ceiling for JSON covering `text`: per ID line, never below ~2x the input's
+    own tokens, and never above the model's output limit. Large ID-tagged inputs stay
+    well under that limit because _split_records gives each record its own call.
+    """
+    records = len(_ID_LINE_RE.findall(text))
+    return min(max(floor, PER_RECORD_MAX_TOKENS * records, len(text) // 2), _model_output_cap(model))
+
+
+def _split_records(raw_text: str) -> List[str]:
+    """
+    Heuristically split messy text into one chunk per employee record so each
+    record can be extracted by its own (short, parallel) LLM call.
+
+    Blocks are separated by blank lines, and a block with several "ID:" lines is
+    cut before each of them. Unless at least two chunks carry an ID marker the
+    text is returned whole, so a single record with stray blank lines is never
+    torn apart; ID-less chunks (headers, noise) are glued onto the next record.
+    """
+    pieces: List[str] = []
+    for block in _BLANK_LINES_RE.split(raw_text):
+        if not block.strip():
+            continue
+        cuts = [m.start() for m in _ID_LINE_RE.finditer(block)][1:]
+        bounds = [0] + cuts + [len(block)]
+        pieces.extend(block[a:b].strip() for a, b in zip(bounds, bounds[1:]) if block[a:b].strip())
+
+    if sum(1 for p in pieces if _ID_LINE_RE.search(p)) < 2:
+        return [raw_text]
+
+    records: List[str] = []
+    pending: List[str] = []
+    for p in pieces:
+        pending.append(p)
+        if _ID_LINE_RE.search(p):
+            records.append("\n".join(pending))
+            pending = []
+    if pending:
+        records[-1] = "\n".join([records[-1]] + pending)
+    return records
+
+
+def _merge_extractions(outputs: List[str]) -> str:
+    """Concatenate per-record {"employees","rejected"} objects into one document."""
+    merged: Dict[str, List[Any]] = {"employees": [], "rejected": []}
+    for out in outputs:
+        try:
+            part = json.loads(out)
+        except json.JSONDecodeError:
+            part = None
+        if not isinstance(part, dict):
+            # leave it to validate/correct: the corrector sees every raw piece
+            return "\n".join(outputs)
+        merged["employees"].extend(part.get("employees") or [])
+        merged["rejected"].extend(part.get("rejected") or [])
+    return json.dumps(merged)
+
+
+def _extract_user(raw_text: str) -> str:
+    # verbatim: json.dumps escaping only burns tokens
+    return raw_text
+
+
+def _log_extract(state: AgentState, out: str, records: int, cache: str) -> AgentState:
+    state["last_json_text"] = out
+    state["log"].append(
+        {
+            "step": "extract",
+            "attempt": state["attempt"],
+            "prompt_hash": EXTRACT_PROMPT_HASH,
+            "records": records,
+            "cache": cache,
+            "output_len": len(out),
+            "output_ref": _store_output(state, out),
+        }
+    )
+    return state
 
 
-def _llm_extract(state: AgentState, api_key: str, model: str) -> AgentState:
-    client = _openai_client(api_key)
-    payload = {"raw_text": state["raw_text"]}
-
-    resp = client.responses.create(
-        model=model,
-        input=[
-            {"role": "system", "content": EXTRACT_SYSTEM},
-            {"role": "user", "content": json.dumps(payload)},
-        ],
-        temperature=0,
-        max_output_tokens=1400,
+def _record_extract(state: AgentState, outputs: List[str], hits: List[bool]) -> AgentState:
+    out = outputs[0] if len(outputs) == 1 else _merge_extractions(outputs)
+    cache = "hit" if all(hits) else ("miss" if not any(hits) else "partial")
+    return _log_extract(state, out, len(outputs), cache)
+
+
+# ---------- Structural template cache ----------
+def _template_key(fp: Tuple[str, ...], model: str) -> str:
+    # a template only stands in for this prompt + model; editing EXTRACT_SYSTEM invalidates it
+    raw = json.dumps([EXTRACT_PROMPT_HASH, model, fp])
+    return "template:" + hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _try_template(state: AgentState, chunks: List[str]) -> bool:
+    """Extract without the LLM when an input of the same key shape was learned before."""
+    fp = fingerprint(state["raw_text"])
+    if len(fp) < 2:
+        return False
+    stored = get_llm_cache().get(_template_key(fp, state["model"]))
+    if stored is None:
+        return False
+    out = apply_template(chunks, json.loads(stored))
+    if out is None:
+        return False
+    _log_extract(state, out, len(chunks), "template")
+    return True
+
+
+def _learn_template(state: AgentState) -> None:
+    """After a validated LLM extraction, remember how this input shape maps onto the schema."""
+    if any(e.get("step") == "extract" and e.get("cache") == "template" for e in state["log"]):
+        return
+    fp = fingerprint(state["raw_text"])
+    if len(fp) < 2:
+        return
+    cache = get_llm_cache()
+    key = _template_key(fp, state["model"])
+    if cache.get(key) is not None:
+        return
+    field_map = learn_template(_split_records(state["raw_text"]), state["result"])
+    if field_map:
+        cache.set(key, json.dumps(field_map))
+
+
+def _llm_extract(state: AgentState, client, model: str) -> AgentState:
+    chunks = _split_records(state["raw_text"])
+    if _try_template(state, chunks):
+        return state
+    if len(chunks) == 1:
+        max_tokens = _output_budget(chunks[0], SINGLE_EXTRACT_MAX_TOKENS, model)
+        results = [_cached_llm_call(client, model, EXTRACT_SYSTEM, _extract_user(chunks[0]), max_tokens)]
+    else:
+        workers = min(len(chunks), int(os.getenv("OPENAI_CONCURRENCY", "5")))
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as ex:
+            results = list(
+                ex.map(
+                    lambda c: _cached_llm_call(
+                        client, model, EXTRACT_SYSTEM, _extract_user(c), _output_budget(c, RECORD_EXTRACT_MAX_TOKENS, model)
+                    ),
+                    chunks,
+                )
+            )
+    return _record_extract(state, [r[0] for r in results], [r[1] for r in results])
+
+
+async def _allm_extract(state: AgentState, client, sem: asyncio.Semaphore, model: str) -> AgentState:
+    chunks = _split_records(state["raw_text"])
+    if _try_template(state, chunks):
+        return state
+    floor = SINGLE_EXTRACT_MAX_TOKENS if len(chunks) == 1 else RECORD_EXTRACT_MAX_TOKENS
+    results = await asyncio.gather(
+        *[
+            _acached_llm_call(client, sem, model, EXTRACT_SYSTEM, _extract_user(c), _output_budget(c, floor, model))
+            for c in chunks
+        ]
     )
-    out = (resp.output_text or "").strip()
+    return _record_extract(state, [r[0] for r in results], [r[1] for r in results])
 
-    state["last_json_text"] = out
-    state["log"].append({"step": "extract", "attempt": state["attempt"], "output": out[:2000]})
-    return state
+
+# ---------- Deterministic auto-repair ----------
+_REQUIRED_EMPLOYEE_FIELDS = {"user_id", "name", "department"}
+_DEPARTMENTS = set(get_args(Department))
+
+
+def _auto_repair(json_text: str, error: ValidationError) -> Optional[str]:
+    """
+    Fix trivially repairable validation errors without another LLM round-trip:
+    - "" in an optional employee field -> null
+    - department spelled differently (e.g. "ai", "DataScience") -> canonical value via DEPT_CANON
+    - performance_score outside 0..10 -> null (same rule the prompts give the model)
+    Returns the repaired JSON text, or None if any error needs the LLM (never guesses required fields).
+    """
+    try:
+        doc = json.loads(json_text)
+    except json.JSONDecodeError:
+        return None
+
+    for err in error.errors():
+        loc = err.get("loc", ())
+        if len(loc) != 3 or loc[0] != "employees":
+            return None
+        _, idx, field = loc
+        try:
+            record = doc["employees"][idx]
+        except (KeyError, IndexError, TypeError):
+            return None
+        value = record.get(field) if isinstance(record, dict) else None
+
+        if field == "department" and err["type"] == "literal_error" and isinstance(value, str):
+            canon, _ = _canon_from_map(value, DEPT_CANON)
+            if canon not in _DEPARTMENTS:
+                return None
+            record[field] = canon
+        elif field in _REQUIRED_EMPLOYEE_FIELDS:
+            return None
+        elif value == "":
+            record[field] = None
+        elif field == "performance_score" and err["type"] in ("greater_than_equal", "less_than_equal"):
+            record[field] = None
+        else:
+            return None
+
+    return json.dumps(doc)
 
 
 def _validate(state: AgentState) -> AgentState:
     try:
-        data = ExtractedData.model_validate_json(state["last_json_text"])
-        state["result"] = _json_safe(data.model_dump())
-        state["validation_error"] = ""
-        state["log"].append({"step": "validate", "attempt": state["attempt"], "status": "pass"})
+        data = EXTRACTED_ADAPTER.validate_json(state["last_json_text"])
     except ValidationError as e:
-        state["result"] = None
-        state["validation_error"] = str(e)
+        repaired = _auto_repair(state["last_json_text"], e)
+        data = None
+        if repaired is not None:
+            try:
+                data = EXTRACTED_ADAPTER.validate_json(repaired)
+            except ValidationError:
+                data = None
+        if data is None:
+            state["result"] = None
+            state["validation_error"] = str(e)
+            state["log"].append(
+                {
+                    "step": "validate",
+                    "attempt": state["attempt"],
+                    "status": "fail",
+                    "error_ref": _store_output(state, state["validation_error"]),
+                }
+            )
+            return state
+        state["last_json_text"] = repaired
         state["log"].append(
             {
-                "step": "validate",
+                "step": "repair",
                 "attempt": state["attempt"],
-                "status": "fail",
-                "error": state["validation_error"][:2000],
+                "fixed_errors": e.error_count(),
+                "output_len": len(repaired),
+                "output_ref": _store_output(state, repaired),
             }
         )
+
+    # mode="json" already yields JSON-safe primitives (NaN/inf -> null, dates -> ISO strings)
+    state["result"] = data.model_dump(mode="json")
+    state["validation_error"] = ""
+    state["log"].append({"step": "validate", "attempt": state["attempt"], "status": "pass"})
+    _learn_template(state)
     return state
 
 
-def _llm_correct(state: AgentState, api_key: str, model: str) -> AgentState:
-    client = _openai_client(api_key)
-    payload = {
-        "previous_json": state["last_json_text"],
-        "validation_error": state["validation_error"],
-    }
+def _correct_user(state: AgentState) -> str:
+    # fixed section order, plain text: the long previous JSON stays a stable prefix across retries
+    return f"PREV_JSON:\n{state['last_json_text']}\n\nVALIDATION_ERROR:\n{state['validation_error']}"
 
-    resp = client.responses.create(
-        model=model,
-        input=[
-            {"role": "system", "content": CORRECT_SYSTEM},
-            {"role": "user", "content": json.dumps(payload)},
-        ],
-        temperature=0,
-        max_output_tokens=1400,
-    )
-    out = (resp.output_text or "").strip()
 
+def _record_correct(state: AgentState, out: str, hit: bool) -> AgentState:
     state["last_json_text"] = out
-    state["log"].append({"step": "correct", "attempt": state["attempt"], "output": out[:2000]})
+    state["log"].append(
+        {
+            "step": "correct",
+            "attempt": state["attempt"],
+            "prompt_hash": CORRECT_PROMPT_HASH,
+            "cache": "hit" if hit else "miss",
+            "output_len": len(out),
+            "output_ref": _store_output(state, out),
+        }
+    )
     return state
 
 
+def _correct_budget(state: AgentState, model: str) -> int:
+    # the correction rewrites the whole document, so it needs room for every record,
+    # and for more than the previous (possibly truncated) attempt, within the model's limit
+    wanted = max(_output_budget(state["raw_text"], CORRECT_MAX_TOKENS, model), len(state["last_json_text"]) // 2)
+    return min(wanted, _model_output_cap(model))
+
+
+def _llm_correct(state: AgentState, client, model: str) -> AgentState:
+    max_tokens = _correct_budget(state, model)
+    out, hit = _cached_llm_call(client, model, CORRECT_SYSTEM, _correct_user(state), max_output_tokens=max_tokens)
+    return _record_correct(state, out, hit)
+
+
+async def _allm_correct(state: AgentState, client, sem: asyncio.Semaphore, model: str) -> AgentState:
+    max_tokens = _correct_budget(state, model)
+    out, hit = await _acached_llm_call(
+        client, sem, model, CORRECT_SYSTEM, _correct_user(state), max_output_tokens=max_tokens
+    )
+    return _record_correct(state, out, hit)
+
+
 def _should_retry(state: AgentState) -> str:
     if state["result"] is not None:
         return "finalize"
@@ -186,9 +522,12 @@ def _should_retry(state: AgentState) -> str:
 def build_graph(api_key: str, model: str):
     g = StateGraph(AgentState)
 
-    g.add_node("extract", lambda s: _llm_extract(s, api_key, model))
+    # one client (and httpx connection pool) shared by every extract/correct step of this graph
+    client = _openai_client(api_key)
+
+    g.add_node("extract", lambda s: _llm_extract(s, client, model))
     g.add_node("validate", _validate)
-    g.add_node("correct", lambda s: _llm_correct(s, api_key, model))
+    g.add_node("correct", lambda s: _llm_correct(s, client, model))
 
     g.set_entry_point("extract")
     g.add_edge("extract", "validate")
@@ -210,16 +549,75 @@ def build_graph(api_key: str, model: str):
     return g.compile()
 
 
-def run_agent(raw_text: str, api_key: str, model: str = "gpt-4.1-mini", max_attempts: int = 3):
-    graph = build_graph(api_key, model)
-    init: AgentState = {
+def _initial_state(raw_text: str, max_attempts: int, model: str = "gpt-4.1-mini") -> AgentState:
+    return {
         "raw_text": raw_text,
+        "model": model,
         "attempt": 1,
         "max_attempts": max_attempts,
         "last_json_text": "",
         "validation_error": "",
         "result": None,
         "log": [],
+        "outputs": [],
     }
-    final_state = graph.invoke(init)
+
+
+def run_agent(raw_text: str, api_key: str, model: str = "gpt-4.1-mini", max_attempts: int = 3):
+    graph = build_graph(api_key, model)
+    final_state = graph.invoke(_initial_state(raw_text, max_attempts, model))
     return final_state
+
+
+def stream_agent(
+    raw_text: str, api_key: str, model: str = "gpt-4.1-mini", max_attempts: int = 3
+) -> Iterator[Tuple[str, AgentState]]:
+    """
+    Like run_agent, but yields (node_name, state) after every graph step so a UI
+    can show progress live. The last yielded state is the final state.
+    """
+    graph = build_graph(api_key, model)
+    state = _initial_state(raw_text, max_attempts, model)
+    for event in graph.stream(state, stream_mode="updates"):
+        for node, update in event.items():
+            state = {**state, **(update or {})}
+            yield node, state
+
+
+# ---------- Batched async runs ----------
+async def _run_one(raw_text: str, client, sem: asyncio.Semaphore, model: str, max_attempts: int) -> AgentState:
+    """Same extract -> validate -> (correct -> validate)* loop as build_graph, driven by hand."""
+    state = _initial_state(raw_text, max_attempts, model)
+    state = await _allm_extract(state, client, sem, model)
+    state = _validate(state)
+    while _should_retry(state) == "retry":
+        state = await _allm_correct(state, client, sem, model)
+        state["attempt"] += 1
+        state = _validate(state)
+    return state
+
+
+async def _run_many(raw_texts: List[str], api_key: str, model: str, max_attempts: int, concurrency: int):
+    client = _async_openai_client(api_key)
+    sem = asyncio.Semaphore(concurrency)
+    try:
+        return await asyncio.gather(*[_run_one(t, client, sem, model, max_attempts) for t in raw_texts])
+    finally:
+        await client.close()
+
+
+def run_agent_many(
+    raw_texts: List[str],
+    api_key: str,
+    model: str = "gpt-4.1-mini",
+    max_attempts: int = 3,
+    concurrency: Optional[int] = None,
+) -> List[AgentState]:
+    """
+    Run the agent over many messy blobs concurrently. Wall-clock is roughly the
+    slowest single run instead of the sum, since the workload is network-bound.
+    Results are returned in input order.
+    """
+    if concurrency is None:
+        concurrency = int(os.getenv("OPENAI_CONCURRENCY", "5"))
+    return asyncio.run(_run_many(raw_texts, api_key, model, max_attempts, max(1, concurrency)))
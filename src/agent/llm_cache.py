@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Optional
+
+DEFAULT_CACHE_PATH = ".cache/llm_cache.sqlite3"
+
+
+def cache_key(model: str, system: str, user: str, **params: Any) -> str:
+    """SHA-256 over everything that determines a temperature=0 response."""
+    extra = json.dumps(params, sort_keys=True, default=str)
+    raw = "\x1f".join([model, system, user, extra])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    Tiny persistent key -> response-text store (sqlite3, stdlib only).
+    Lets repeated demos/tests skip the OpenAI round-trip for byte-identical prompts.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH):
+        if path != ":memory:":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO responses (key, value) VALUES (?, ?)", (key, value))
+            self._conn.commit()
+
+
+@lru_cache(maxsize=1)
+def get_llm_cache() -> LLMCache:
+    """
+    Process-wide cache at $LLM_CACHE_PATH (default .cache/llm_cache.sqlite3).
+    Point it elsewhere to relocate the cache, or set it to ":memory:" to keep nothing
+    on disk; deleting the file clears it.
+    """
+    return LLMCache(os.getenv("LLM_CACHE_PATH", DEFAULT_CACHE_PATH))
@@ -1,7 +1,7 @@
 from __future__ import annotations
 from typing import List, Dict, Any, Optional
 from pydantic import ValidationError
-from src.agent.schemas import ExtractedData
+from src.agent.schemas import EXTRACTED_ADAPTER
 
 def run_offline_agent(raw_text: str, candidate_json_outputs: List[str], max_attempts: int = 3):
     """
@@ -17,7 +17,7 @@ def run_offline_agent(raw_text: str, candidate_json_outputs: List[str], max_atte
         log.append({"step": "extract", "attempt": attempt, "output": out})
 
         try:
-            data = ExtractedData.model_validate_json(out)
+            data = EXTRACTED_ADAPTER.validate_json(out)
             log.append({"step": "validate", "attempt": attempt, "status": "pass"})
             return {"result": data.model_dump(), "log": log, "last_json_text": last}
         except ValidationError as e:
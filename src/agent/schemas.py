@@ -3,7 +3,7 @@ from __future__ import annotations
 from datetime import date
 from typing import List, Optional, Literal
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, TypeAdapter, field_validator
 
 Department = Literal[
     "Artificial Intelligence",
@@ -43,3 +43,8 @@ class ExtractedData(BaseModel):
 
     # Records that cannot be made valid WITHOUT guessing required fields
     rejected: List[RejectedRecord] = Field(default_factory=list)
+
+
+# Built once at import so hot validation loops (graph retries, offline replays)
+# reuse the resolved core schema instead of going through the model class each call.
+EXTRACTED_ADAPTER: TypeAdapter[ExtractedData] = TypeAdapter(ExtractedData)
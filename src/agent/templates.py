@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import json
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+from dateutil import parser as dateutil_parser
+
+from src.agent.schemas import EXTRACTED_ADAPTER
+from src.core.cleaning import DEPT_CANON, EMAIL_RE, _SALARY_STRIP, _canon_from_map, _clean_date, _parse_numbers, clean_dataframe
+
+# "Key: value", "Key = value", "Key => value"; the key is the word right before the separator
+_KEY_RE = re.compile(r"\b([A-Za-z_]+)\s*(?::|=>|=)\s*")
+_HEDGE_RE = re.compile(r"\b(maybe|around|probably|approx\w*|roughly|about|ish)\b|\?", re.IGNORECASE)
+_ALNUM_RE = re.compile(r"[^a-z0-9@.]")
+# separators/punctuation that may sit between pairs without carrying data
+_FILLER_RE = re.compile(r"[\s,;|/\-]+")
+
+FIELDS = [
+    "user_id", "name", "age", "email", "salary", "join_date",
+    "department", "performance_score", "location", "job_title",
+]
+REQUIRED = {"user_id", "name", "department"}
+
+
+def fingerprint(raw_text: str) -> Tuple[str, ...]:
+    """Structural shape of an input: the sorted set of 'key:' names it uses."""
+    return tuple(sorted({m.group(1).lower() for m in _KEY_RE.finditer(raw_text)}))
+
+
+def _pair_spans(record: str) -> List[Tuple[str, str, int, int]]:
+    """(key, raw value, start, end); a value runs until the next key or the end of its line."""
+    matches = list(_KEY_RE.finditer(record))
+    spans = []
+    for m, nxt in zip(matches, matches[1:] + [None]):
+        end = nxt.start() if nxt is not None else len(record)
+        line = record[m.end():end].split("\n", 1)[0]
+        spans.append((m.group(1).lower(), line.strip(), m.start(), m.end() + len(line)))
+    return spans
+
+
+def parse_pairs(record: str) -> List[Tuple[str, str]]:
+    """(key, raw value) pairs; a value runs until the next key or the end of its line."""
+    return [(key, value) for key, value, _, _ in _pair_spans(record)]
+
+
+def _fully_consumed(record: str) -> bool:
+    """True if every non-blank bit of the record belongs to some 'key: value' pair."""
+    leftover, pos = [], 0
+    for _, _, start, end in _pair_spans(record):
+        leftover.append(record[pos:start])
+        pos = end
+    leftover.append(record[pos:])
+    return not _FILLER_RE.sub("", "".join(leftover))
+
+
+def _strict_date(value: str) -> Optional[str]:
+    """
+    ISO date only if `value` spells out a full calendar date: no fuzzy matching, and
+    nothing filled in from a default (parsing with two different defaults must agree).
+    """
+    try:
+        a = dateutil_parser.parse(value, default=datetime(2000, 1, 1))
+        b = dateutil_parser.parse(value, default=datetime(2001, 2, 2))
+    except (ValueError, OverflowError):
+        return None
+    return a.date().isoformat() if a == b else None
+
+
+def apply_template(records: List[str], field_map: Dict[str, str]) -> Optional[str]:
+    """
+    Deterministically extract records with a learned key -> field mapping.
+    Returns schema-valid JSON text, or None whenever the LLM should decide instead:
+    hedged values, text outside any 'key: value' pair, conflicting duplicate keys,
+    values that don't parse cleanly, or a missing required field. It never produces
+    "rejected" entries, so anything that would need rejecting falls through.
+    """
+    rows = []
+    for rec in records:
+        if _HEDGE_RE.search(rec) or not _fully_consumed(rec):
+            return None
+        row: Dict[str, str] = {}
+        for key, value in parse_pairs(rec):
+            field = field_map.get(key)
+            if field is None or value == "":
+                continue
+            if field in row and row[field] != value:
+                return None
+            row[field] = value
+        if not REQUIRED <= row.keys():
+            return None
+        rows.append(row)
+    if not rows:
+        return None
+
+    raw = pd.DataFrame(rows, columns=FIELDS, dtype=object)
+    clean, _ = clean_dataframe(raw)
+
+    # a value the cleaners could not parse ("29 years", "95k", "8/10") must go to the LLM
+    # rather than silently become null; only the prompt's own email/score rules may null below
+    parsed = [f for f in FIELDS if f not in ("user_id", "email")]
+    if (raw[parsed].notna() & clean[parsed].isna()).to_numpy().any():
+        return None
+    # the cleaners fall back to fuzzy/partial date parsing ("early 2023", "Q3 2023");
+    # a template may only take dates that are unambiguous on their own
+    for value, iso in zip(raw["join_date"], clean["join_date"]):
+        if not pd.isna(value) and _strict_date(value) != iso:
+            return None
+
+    user_ids = pd.to_numeric(raw["user_id"].str.strip(), errors="coerce")
+    if user_ids.isna().any() or not user_ids.eq(user_ids.round()).all():
+        return None
+    clean["user_id"] = user_ids.astype(int)
+
+    # same rules the extraction prompt gives the model: never invent emails, 0..10 scores only
+    email = clean["email"].astype(object)
+    clean["email"] = email.where(raw["email"].notna() & email.map(lambda e: bool(EMAIL_RE.match(str(e)))), None)
+    perf = clean["performance_score"]
+    clean["performance_score"] = perf.where(perf.between(0, 10))
+
+    employees = clean.astype(object).where(clean.notna(), None).to_dict(orient="records")
+    try:
+        data = EXTRACTED_ADAPTER.validate_json(json.dumps({"employees": employees, "rejected": []}, default=int))
+    except ValueError:
+        return None
+    return json.dumps(data.model_dump(mode="json"))
+
+
+def _candidates(raw: str) -> Tuple[set, set]:
+    """Normalized string and numeric readings of a raw value, for matching against LLM output."""
+    strings = {_ALNUM_RE.sub("", raw.lower())}
+    canon, _ = _canon_from_map(raw, DEPT_CANON)
+    strings.add(_ALNUM_RE.sub("", canon.lower()))
+    iso, _ = _clean_date(raw)
+    if iso:
+        strings.add(_ALNUM_RE.sub("", iso))
+    strings.add(_ALNUM_RE.sub("", raw.lower().replace(" at ", "@").replace(" dot ", ".")))
+    numbers = set(_parse_numbers(pd.Series([raw, _SALARY_STRIP.sub("", raw)])).dropna().tolist())
+    return strings, numbers
+
+
+def learn_template(records: List[str], result: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    """
+    Infer key -> field mapping from a validated LLM extraction of the same records.
+    The mapping is only returned if re-applying it reproduces the LLM result exactly.
+    """
+    employees = result.get("employees") or []
+    if result.get("rejected") or not employees or len(employees) != len(records):
+        return None
+
+    votes: Dict[str, set] = {}
+    for rec, emp in zip(records, employees):
+        for key, value in parse_pairs(rec):
+            strings, numbers = _candidates(value)
+            for field, target in emp.items():
+                if target is None:
+                    continue
+                if isinstance(target, (int, float)) and not isinstance(target, bool):
+                    hit = float(target) in numbers
+                else:
+                    hit = _ALNUM_RE.sub("", str(target).lower()) in strings
+                if hit:
+                    votes.setdefault(key, set()).add(field)
+
+    field_map = {k: next(iter(fs)) for k, fs in votes.items() if len(fs) == 1}
+    if not REQUIRED <= set(field_map.values()):
+        return None
+    # every key must be understood, otherwise a later input of this shape would silently drop data
+    if {k for rec in records for k, _ in parse_pairs(rec)} - field_map.keys():
+        return None
+
+    replayed = apply_template(records, field_map)
+    if replayed is None or json.loads(replayed)["employees"] != employees:
+        return None
+    return field_map
@@ -4,6 +4,7 @@ import re
 from dataclasses import dataclass
 from typing import Dict, List, Tuple, Optional
 
+import numpy as np
 import pandas as pd
 from dateutil import parser as dtparser
 from rapidfuzz import process, fuzz
@@ -37,6 +38,12 @@ LOCATION_CANON = {
 
 EMAIL_RE = re.compile(r"^[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}$")
 
+_DIGITS_RE = re.compile(r"\d+")
+_SPLIT_RE = re.compile(r"[\s\-]+")
+_SALARY_STRIP = re.compile(r"[,$]|usd", re.I)
+_MULTI_AT = re.compile(r"@{2,}")
+_WS_RE = re.compile(r"\s+")
+
 @dataclass
 class CleaningReport:
     rows: int
@@ -47,56 +54,65 @@ def _clean_name(s: str) -> Optional[str]:
     if s is None or pd.isna(s):
         return None
     s = str(s).strip()
-    s = re.sub(r"\s+", " ", s)
+    s = _WS_RE.sub(" ", s)
     s = " ".join([w.capitalize() for w in s.split()])
     return s if s else None
 
-def _parse_word_number(s: str) -> Optional[int]:
-    if s is None:
-        return None
-    t = str(s).strip().lower()
-    if t == "":
-        return None
-    if re.fullmatch(r"\d+", t):
-        return int(t)
-    parts = re.split(r"[\s\-]+", t)
-    total = 0
-    matched = False
-    for p in parts:
-        if p in WORD_NUMS:
-            total += WORD_NUMS[p]
-            matched = True
-        else:
-            return None
-    return total if matched else None
-
-def _clean_email(s: str) -> Tuple[str, bool]:
-    if s is None:
-        return "unknown@unknown.com", True
-    t = str(s).strip().lower()
-    if t == "":
-        return "unknown@unknown.com", True
-    t = t.replace(" at ", "@").replace(" dot ", ".")
-    t = t.replace("..", ".")
-    t = re.sub(r"@{2,}", "@", t)
-    if EMAIL_RE.match(t):
-        return t, (t != str(s).strip().lower())
-    if "@" in t and "." not in t.split("@", 1)[1]:
-        return t, False
-    return t, False
-
-def _clean_salary(s: str) -> Tuple[Optional[float], bool]:
-    if s is None:
-        return None, False
-    t = str(s).strip()
-    if t == "" or t.lower() == "nan":
-        return None, False
-    t2 = re.sub(r"[,$]", "", t)
-    t2 = re.sub(r"usd", "", t2, flags=re.I).strip()
-    try:
-        return float(t2), (t2 != t)
-    except ValueError:
-        return None, False
+def _parse_numbers(col: pd.Series) -> pd.Series:
+    """
+    Column-wide word-number parsing ("twenty nine", "thirty-two", "9") with a plain
+    float fallback ("8.5"). Stays in pandas/NumPy: digits via to_numeric, words via
+    split -> explode -> map(WORD_NUMS) -> groupby-sum, so there is no per-row Python loop.
+    """
+    t = col.astype("string").str.strip().str.lower()
+    digits = t.where(t.str.fullmatch(_DIGITS_RE).fillna(False).astype(bool))
+    nums = pd.to_numeric(digits, errors="coerce").astype(float)
+
+    residual = t[nums.isna() & t.notna() & (t != "")]
+    if len(residual):
+        parts = residual.str.split(_SPLIT_RE, regex=True).explode()
+        values = parts.map(WORD_NUMS)
+        grouped = values.groupby(level=0)
+        words = grouped.sum().where(grouped.count() == grouped.size())
+        nums = nums.fillna(words.astype(float))
+        nums = nums.fillna(pd.to_numeric(residual, errors="coerce").astype(float))
+    return nums
+
+def _as_object(s: pd.Series) -> pd.Series:
+    """Back to plain object dtype with None for missing, like the old per-row lists."""
+    return s.astype(object).where(s.notna(), None)
+
+def _count_changed(before: pd.Series, after: pd.Series) -> int:
+    """
+    Cells that differ after cleaning. Missing -> missing (None/NaN/pd.NA) is not a fix;
+    NA-safe, so Arrow-backed frames give an int.
+    """
+    b_na = before.isna().to_numpy()
+    a_na = after.isna().to_numpy()
+    b = before.to_numpy(dtype=object, na_value=None)
+    a = after.to_numpy(dtype=object, na_value=None)
+    return int(((b_na != a_na) | (~b_na & ~a_na & (b != a))).sum())
+
+def _clean_emails(col: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    norm = col.astype("string").str.strip().str.lower()
+    t = (
+        norm.str.replace(" at ", "@", regex=False)
+        .str.replace(" dot ", ".", regex=False)
+        .str.replace("..", ".", regex=False)
+        .str.replace(_MULTI_AT, "@", regex=True)
+    )
+    missing = t.isna() | (t == "")
+    valid = t.str.match(EMAIL_RE).fillna(False).astype(bool)
+    cleaned = t.mask(missing, "unknown@unknown.com")
+    changed = missing | (valid & (t != norm).fillna(False))
+    return cleaned, changed
+
+def _clean_salaries(col: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    t = col.astype("string").str.strip()
+    t2 = t.str.replace(_SALARY_STRIP, "", regex=True).str.strip()
+    vals = pd.to_numeric(t2, errors="coerce").astype(float)
+    changed = vals.notna() & (t2 != t).fillna(False).astype(bool)
+    return vals, changed
 
 def _clean_date(s: str) -> Tuple[Optional[str], bool]:
     if s is None:
@@ -111,6 +127,21 @@ def _clean_date(s: str) -> Tuple[Optional[str], bool]:
     except Exception:
         return None, False
 
+def _clean_dates(col: pd.Series) -> Tuple[pd.Series, pd.Series]:
+    t = col.astype("string").str.strip()
+    try:
+        parsed = pd.to_datetime(t, errors="coerce", format="mixed", dayfirst=False, cache=True)
+        iso = parsed.dt.strftime("%Y-%m-%d").astype("string")
+    except (ValueError, TypeError):
+        # e.g. mixed timezone offsets; let dateutil handle every distinct value
+        iso = pd.Series(pd.NA, index=t.index, dtype="string")
+    # the C parser has no fuzzy mode ("joined on March 3 2024"): dateutil only for those distinct leftovers
+    leftover = t[iso.isna() & t.notna() & (t != "") & (t.str.lower() != "nan")].unique()
+    if len(leftover):
+        iso = iso.fillna(t.map({v: _clean_date(v)[0] for v in leftover}).astype("string"))
+    changed = (iso.notna() & (iso != t)).fillna(False).astype(bool)
+    return iso, changed
+
 def _canon_from_map(value: str, mapping: Dict[str, str], threshold: int = 90) -> Tuple[str, bool]:
     raw = (value or "").strip()
     if raw == "":
@@ -125,6 +156,52 @@ def _canon_from_map(value: str, mapping: Dict[str, str], threshold: int = 90) ->
         return canon, canon != raw
     return raw, False
 
+def _canon_series(col: pd.Series, mapping: Dict[str, str], threshold: int = 90) -> Tuple[pd.Series, pd.Series]:
+    """Vectorized _canon_from_map: exact dict lookup first, fuzzy matching only for leftover distinct values."""
+    raw = col.astype("string").str.strip()
+    canon = raw.str.lower().map(mapping)
+    residual = raw[canon.isna() & raw.notna() & (raw != "")].unique()
+    if len(residual):
+        # one C-level score matrix (distinct leftovers x map keys) instead of an extractOne per value
+        keys = list(mapping.keys())
+        scores = process.cdist([v.lower() for v in residual], keys, scorer=fuzz.ratio, workers=-1)
+        best = scores.argmax(axis=1)
+        best_score = scores.max(axis=1)
+        fuzzy = {v: mapping[keys[b]] for v, b, sc in zip(residual, best, best_score) if sc >= threshold}
+        canon = canon.fillna(raw.map(fuzzy))
+    canon = canon.fillna(raw).astype("string")
+    changed = (canon != raw).fillna(False).astype(bool)
+    return canon, changed
+
+def _smallest_int(s: pd.Series) -> pd.Series:
+    """Nullable Int8/16/32/64, whichever is the narrowest that holds every value."""
+    s = pd.to_numeric(s, errors="coerce")
+    vals = s.dropna()
+    if not vals.eq(vals.round()).all():
+        return s
+    for dtype in ("Int8", "Int16", "Int32", "Int64"):
+        info = np.iinfo(dtype.lower())
+        if vals.between(info.min, info.max).all():
+            return s.astype(dtype)
+    return s
+
+def _downcast(out: pd.DataFrame, name_col, age_col, dept_col, loc_col) -> pd.DataFrame:
+    """
+    Shrink the cleaned frame kept in st.session_state: narrow nullable ints for age,
+    categoricals for the low-cardinality department/location columns, Arrow-backed strings
+    for names (pyarrow is a hard dependency since the CSV-engine change).
+    Categories are inferred (not the fixed canon list) so unmapped raw values survive.
+    """
+    if age_col:
+        out[age_col] = _smallest_int(out[age_col])
+    if dept_col:
+        out[dept_col] = out[dept_col].astype("category")
+    if loc_col:
+        out[loc_col] = out[loc_col].astype("category")
+    if name_col:
+        out[name_col] = out[name_col].astype("string[pyarrow]")
+    return out
+
 def clean_dataframe(df: pd.DataFrame) -> Tuple[pd.DataFrame, CleaningReport]:
     out = df.copy()
     fixes: Dict[str, int] = {}
@@ -143,102 +220,49 @@ def clean_dataframe(df: pd.DataFrame) -> Tuple[pd.DataFrame, CleaningReport]:
     loc_col = col_map.get("location")
 
     if name_col:
-        before = out[name_col].astype(str).tolist()
+        before = out[name_col].copy()
         out[name_col] = out[name_col].apply(_clean_name)
-        fixes["name_normalized"] = sum(b != a for b, a in zip(before, out[name_col].tolist()))
+        fixes["name_normalized"] = _count_changed(before, out[name_col])
 
     if age_col:
-        def clean_age(x):
-            if x is None:
-                return None
-            t = str(x).strip().lower()
-            if t == "":
-                return None
-            n = _parse_word_number(t)
-            if n is not None:
-                return n
-            try:
-                return int(float(t))
-            except Exception:
-                return None
-        before = out[age_col].tolist()
-        out[age_col] = out[age_col].apply(clean_age)
-        fixes["age_parsed"] = sum(b != a for b, a in zip(before, out[age_col].tolist()))
+        before = out[age_col].copy()
+        ages = _parse_numbers(out[age_col])
+        # int(float(x)) semantics: truncate, and drop inf which has no integer age
+        out[age_col] = np.trunc(ages.where(np.isfinite(ages)))
+        fixes["age_parsed"] = _count_changed(before, out[age_col])
 
     if email_col:
-        before = out[email_col].tolist()
-        new_vals, changed = [], 0
-        for v in before:
-            cleaned, did = _clean_email(v)
-            if did:
-                changed += 1
-            new_vals.append(cleaned)
-        out[email_col] = new_vals
-        fixes["email_cleaned"] = changed
-        invalid = [e for e in out[email_col].tolist() if not EMAIL_RE.match(e)]
-        if invalid:
-            warnings.append(f"{len(invalid)} email(s) still look invalid (e.g., '{invalid[0]}').")
+        cleaned, changed = _clean_emails(out[email_col])
+        out[email_col] = _as_object(cleaned)
+        fixes["email_cleaned"] = int(changed.sum())
+        invalid = cleaned[~cleaned.str.match(EMAIL_RE).fillna(False).astype(bool)]
+        if len(invalid):
+            warnings.append(f"{len(invalid)} email(s) still look invalid (e.g., '{invalid.iloc[0]}').")
 
     if salary_col:
-        before = out[salary_col].tolist()
-        vals, changed = [], 0
-        for v in before:
-            s2, did = _clean_salary(v)
-            if did:
-                changed += 1
-            vals.append(s2)
+        vals, changed = _clean_salaries(out[salary_col])
         out[salary_col] = vals
-        fixes["salary_cleaned"] = changed
+        fixes["salary_cleaned"] = int(changed.sum())
 
     if join_col:
-        before = out[join_col].tolist()
-        vals, changed = [], 0
-        for v in before:
-            d2, did = _clean_date(v)
-            if did:
-                changed += 1
-            vals.append(d2)
-        out[join_col] = vals
-        fixes["join_date_normalized"] = changed
+        iso, changed = _clean_dates(out[join_col])
+        out[join_col] = _as_object(iso)
+        fixes["join_date_normalized"] = int(changed.sum())
 
     if dept_col:
-        before = out[dept_col].astype(str).tolist()
-        new, changed = [], 0
-        for v in before:
-            canon, did = _canon_from_map(v, DEPT_CANON, threshold=90)
-            if did:
-                changed += 1
-            new.append(canon)
-        out[dept_col] = new
-        fixes["department_standardized"] = changed
+        canon, changed = _canon_series(out[dept_col], DEPT_CANON, threshold=90)
+        out[dept_col] = _as_object(canon)
+        fixes["department_standardized"] = int(changed.sum())
 
     if loc_col:
-        before = out[loc_col].astype(str).tolist()
-        new, changed = [], 0
-        for v in before:
-            canon, did = _canon_from_map(v, LOCATION_CANON, threshold=88)
-            if did:
-                changed += 1
-            new.append(canon)
-        out[loc_col] = new
-        fixes["location_standardized"] = changed
+        canon, changed = _canon_series(out[loc_col], LOCATION_CANON, threshold=88)
+        out[loc_col] = _as_object(canon)
+        fixes["location_standardized"] = int(changed.sum())
 
     if perf_col:
-        before = out[perf_col].tolist()
-        def clean_perf(x):
-            if x is None:
-                return None
-            t = str(x).strip().lower()
-            if t == "" or t == "nan":
-                return None
-            n = _parse_word_number(t)
-            if n is not None:
-                return float(n)
-            try:
-                return float(t)
-            except Exception:
-                return None
-        out[perf_col] = out[perf_col].apply(clean_perf)
-        fixes["performance_parsed"] = sum(b != a for b, a in zip(before, out[perf_col].tolist()))
+        before = out[perf_col].copy()
+        out[perf_col] = _parse_numbers(out[perf_col])
+        fixes["performance_parsed"] = _count_changed(before, out[perf_col])
 
+    out = _downcast(out, name_col, age_col, dept_col, loc_col)
     return out, CleaningReport(rows=len(out), fixes=fixes, warnings=warnings)
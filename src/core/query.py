@@ -1,9 +1,23 @@
 from __future__ import annotations
 
-from typing import Any, List
+import asyncio
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+import numpy as np
 import pandas as pd
-from pydantic import BaseModel, Field, ValidationError
+from pydantic import BaseModel, Field
 import math
+import orjson
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:  # pragma: no cover - pyarrow is in requirements.txt, keep a pure-pandas path anyway
+    pa = pc = None
 
 
 class FilterSpec(BaseModel):
@@ -17,16 +31,35 @@ class QuerySpec(BaseModel):
     distinct: bool = True
     limit: int = 50
 
+# Hand-written rather than QuerySpec.model_json_schema(): strict structured outputs need
+# every property required, additionalProperties=false and a concrete type for `value`.
+_SCALAR = [{"type": "string"}, {"type": "number"}, {"type": "boolean"}, {"type": "null"}]
+QUERY_SPEC_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "select": {"type": "array", "items": {"type": "string"}},
+        "filters": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "column": {"type": "string"},
+                    "op": {"type": "string", "enum": ["eq", "neq", "contains", "in", "gte", "lte"]},
+                    "value": {"anyOf": _SCALAR + [{"type": "array", "items": {"anyOf": _SCALAR}}]},
+                },
+                "required": ["column", "op", "value"],
+                "additionalProperties": False,
+            },
+        },
+        "distinct": {"type": "boolean"},
+        "limit": {"type": "integer"},
+    },
+    "required": ["select", "filters", "distinct", "limit"],
+    "additionalProperties": False,
+}
+
 SYSTEM_PROMPT = """You are a data query planner.
-You receive:
-- user_question
-- available_columns
-- sample_values (small)
-Return ONLY valid JSON for QuerySpec with:
-- select: columns needed
-- filters: list of {column, op, value}
-- distinct: true/false
-- limit: integer <= 200
+Given AVAILABLE_COLUMNS, a small SAMPLE and a QUESTION, plan a query (limit <= 200).
 
 Rules:
 - Prefer deterministic, simple filters.
@@ -35,8 +68,8 @@ Rules:
 - Do NOT invent columns.
 """
 def _json_safe(obj):
-    """Recursively convert NaN/inf to None so payload becomes valid JSON."""
-    if obj is None:
+    """Recursively convert NaN/inf/pd.NA to None so payload becomes valid JSON."""
+    if obj is None or obj is pd.NA:
         return None
 
     if isinstance(obj, float):
@@ -52,93 +85,347 @@ def _json_safe(obj):
 
     return obj
 
+def _records(df: pd.DataFrame) -> List[dict]:
+    """Rows as dicts with every missing cell (NaN/NaT/pd.NA) as None, in one vectorized pass."""
+    return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+
+def _dumps(payload: Any) -> str:
+    """
+    Serialize with orjson (C, NaN/inf -> null natively, numpy scalars supported).
+    Only if it meets something it can't encode do we pay for the recursive _json_safe walk.
+    """
+    opts = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    try:
+        return orjson.dumps(payload, option=opts).decode()
+    except TypeError:
+        return orjson.dumps(_json_safe(payload), option=opts).decode()
+
+@lru_cache(maxsize=1)
+def _http_client():
+    import httpx
+    from openai import DefaultHttpxClient
+
+    # one keep-alive pool for every planner/summarizer call: no TLS handshake per question
+    return DefaultHttpxClient(limits=httpx.Limits(max_connections=32, max_keepalive_connections=16))
+
+@lru_cache(maxsize=4)
 def _openai_client(api_key: str):
+    """
+    Cached per API key. OpenAI clients are safe to share across threads (Streamlit
+    reruns, ThreadPoolExecutor in the eval scripts); they hold no per-request state.
+    """
     from openai import OpenAI
-    return OpenAI(api_key=api_key)
+    return OpenAI(api_key=api_key, http_client=_http_client())
 
-def plan_query_with_llm(user_question: str, df: pd.DataFrame, api_key: str, model: str = "gpt-4.1-mini") -> QuerySpec:
-    cols = list(df.columns)
-    sample_df = df.head(8).copy()
-    sample_df = sample_df.where(pd.notna(sample_df), None)
-    sample = _json_safe(sample_df.to_dict(orient="records"))
+def _plan_request(user_question: str, df: pd.DataFrame, model: str) -> Dict[str, Any]:
+    """responses.create kwargs for planning one question; shared by the sync and async planners."""
+    # stable-per-dataset content first, the question last, so every question against
+    # the same CSV shares one cached prompt prefix on OpenAI's side
+    cols_json = _dumps(list(df.columns))
+    sample_json = _dumps(_records(df.head(8)))
+    user = f"AVAILABLE_COLUMNS:\n{cols_json}\n\nSAMPLE:\n{sample_json}\n\nQUESTION:\n{user_question}"
+    return {
+        "model": model,
+        "input": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": user},
+        ],
+        "temperature": 0,
+        "max_output_tokens": 600,
+        "text": {"format": {"type": "json_schema", "name": "QuerySpec", "schema": QUERY_SPEC_SCHEMA, "strict": True}},
+        # routes requests for the same schema to the same prefix-cache entry; sent via
+        # extra_body because older openai SDKs don't accept prompt_cache_key as a kwarg
+        "extra_body": {"prompt_cache_key": hashlib.sha256(cols_json.encode("utf-8")).hexdigest()[:32]},
+    }
 
+def _parse_plan(text: str) -> QuerySpec:
+    # the response is constrained to QUERY_SPEC_SCHEMA, so this only fails on a
+    # truncated/refused response (pydantic's ValidationError is a ValueError)
+    spec = QuerySpec.model_validate_json(text)
+    spec.limit = max(1, min(int(spec.limit), 200))
+    return spec
 
+EMBED_MODEL = "text-embedding-3-small"
+SIMILARITY_THRESHOLD = 0.92
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:'t)?")
+_NEGATIONS = frozenset({
+    "not", "no", "non", "none", "without", "except", "excluding", "exclude", "excludes",
+    "never", "nor", "other", "others", "outside", "besides",
+})
+_STOPWORDS = frozenset({
+    "a", "an", "the", "in", "of", "and", "or", "for", "to", "with", "by", "on", "at", "is", "are",
+    "who", "what", "which", "show", "list", "give", "me", "all", "their", "from", "that", "as",
+})
+_VOCAB_VALUES_PER_COLUMN = 1000
 
-    client = _openai_client(api_key)
-    import json  # add at top of file if not present
+def _dataset_fingerprint(df: pd.DataFrame) -> str:
+    """Hash of what the planner actually sees (columns + sample), so different CSVs never share plans."""
+    raw = _dumps(list(df.columns)) + "\x1f" + _dumps(_records(df.head(8)))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
 
-    payload = {
-    "user_question": user_question,
-    "available_columns": cols,
-    "sample_values": sample,
-}
+def _normalize_question(q: str) -> str:
+    return " ".join(q.lower().split())
 
-    resp = client.responses.create(
-    model=model,
-    input=[
-        {"role": "system", "content": SYSTEM_PROMPT},
-        {"role": "user", "content": json.dumps(payload)},
-    ],
-    temperature=0,
-    max_output_tokens=600,
-)
+def _tokens(text: str) -> List[str]:
+    return _TOKEN_RE.findall(str(text).lower())
+
+def _dataset_vocab(df: pd.DataFrame) -> frozenset:
+    """Words that name a column or occur in a text value; these decide what a filter targets."""
+    words = set()
+    for col in df.columns:
+        words.update(_tokens(col.replace("_", " ")))
+        s = df[col]
+        if pd.api.types.is_numeric_dtype(s.dtype) or pd.api.types.is_bool_dtype(s.dtype):
+            continue
+        for value in s.dropna().unique()[:_VOCAB_VALUES_PER_COLUMN]:
+            words.update(_tokens(value))
+    return frozenset(words - _STOPWORDS)
+
+def _question_signature(question: str, vocab: frozenset) -> Tuple[Any, ...]:
+    """
+    What two questions must share before one's plan may answer the other: the same
+    numbers, the same negations ("in AI" vs "not in AI") and the same dataset words
+    ("Data Science" vs "Machine Learning").
+    """
+    toks = _tokens(question)
+    negations = frozenset(t for t in toks if t in _NEGATIONS or t.endswith("'t"))
+    anchors = frozenset(t for t in toks if t in vocab)
+    return tuple(_NUMBER_RE.findall(question)), negations, anchors
+
+class PlanCache:
+    """
+    In-process QuerySpec cache: exact (normalized) question first, then embedding
+    similarity within the same dataset/model. A similar question is only reused if its
+    _question_signature matches too, so "salary over 90k" never answers "salary over
+    100k" and "not in AI" never answers "in AI".
+    """
+
+    def __init__(self, maxsize: int = 256, threshold: float = SIMILARITY_THRESHOLD):
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._exact: "OrderedDict[Tuple[str, str, str], QuerySpec]" = OrderedDict()
+        self._vectors: Dict[Tuple[str, str], List[Tuple[np.ndarray, Tuple[Any, ...], QuerySpec]]] = {}
+
+    def get(self, scope: Tuple[str, str], question: str) -> Optional[QuerySpec]:
+        key = (*scope, _normalize_question(question))
+        with self._lock:
+            spec = self._exact.get(key)
+            if spec is not None:
+                self._exact.move_to_end(key)
+        return spec.model_copy(deep=True) if spec is not None else None
 
+    def get_similar(self, scope: Tuple[str, str], vec: np.ndarray, signature: Tuple[Any, ...]) -> Optional[QuerySpec]:
+        with self._lock:
+            entries = list(self._vectors.get(scope, ()))
+        if not entries:
+            return None
+        sims = np.vstack([v for v, _, _ in entries]) @ vec
+        best = int(np.argmax(sims))
+        _, cached_signature, spec = entries[best]
+        if sims[best] < self.threshold or cached_signature != signature:
+            return None
+        return spec.model_copy(deep=True)
+
+    def put(
+        self,
+        scope: Tuple[str, str],
+        question: str,
+        spec: QuerySpec,
+        vec: Optional[np.ndarray] = None,
+        signature: Tuple[Any, ...] = (),
+    ) -> None:
+        with self._lock:
+            self._exact[(*scope, _normalize_question(question))] = spec.model_copy(deep=True)
+            while len(self._exact) > self.maxsize:
+                self._exact.popitem(last=False)
+            if vec is not None:
+                bucket = self._vectors.setdefault(scope, [])
+                bucket.append((vec, signature, spec.model_copy(deep=True)))
+                del bucket[:-self.maxsize]
+
+_PLAN_CACHE = PlanCache()
 
-    text = resp.output_text
+def _unit(vec: List[float]) -> np.ndarray:
+    v = np.asarray(vec, dtype=np.float32)
+    return v / (np.linalg.norm(v) or 1.0)
+
+def _embed(client, question: str) -> Optional[np.ndarray]:
+    # the cache is best-effort: if embedding fails we still plan normally
     try:
-        spec = QuerySpec.model_validate_json(text)
-        spec.limit = max(1, min(int(spec.limit), 200))
+        return _unit(client.embeddings.create(model=EMBED_MODEL, input=question).data[0].embedding)
+    except Exception:
+        return None
+
+async def _aembed(client, question: str) -> Optional[np.ndarray]:
+    try:
+        resp = await client.embeddings.create(model=EMBED_MODEL, input=question)
+        return _unit(resp.data[0].embedding)
+    except Exception:
+        return None
+
+def plan_query_with_llm(user_question: str, df: pd.DataFrame, api_key: str, model: str = "gpt-4.1-mini") -> QuerySpec:
+    scope = (_dataset_fingerprint(df), model)
+    spec = _PLAN_CACHE.get(scope, user_question)
+    if spec is not None:
+        return spec
+
+    client = _openai_client(api_key)
+    vec = _embed(client, user_question)
+    signature = _question_signature(user_question, _dataset_vocab(df)) if vec is not None else ()
+    if vec is not None:
+        spec = _PLAN_CACHE.get_similar(scope, vec, signature)
+        if spec is not None:
+            return spec
+
+    resp = client.responses.create(**_plan_request(user_question, df, model))
+    spec = _parse_plan(resp.output_text)
+    _PLAN_CACHE.put(scope, user_question, spec, vec, signature)
+    return spec
+
+async def _aplan(client, sem: asyncio.Semaphore, user_question: str, df: pd.DataFrame, model: str) -> QuerySpec:
+    scope = (_dataset_fingerprint(df), model)
+    spec = _PLAN_CACHE.get(scope, user_question)
+    if spec is not None:
         return spec
-    except ValidationError as e:
-        raise ValueError(f"Could not parse model output as QuerySpec JSON. Raw output:\\n{text}\\n\\nError:\\n{e}")
+
+    async with sem:
+        vec = await _aembed(client, user_question)
+        signature = _question_signature(user_question, _dataset_vocab(df)) if vec is not None else ()
+        if vec is not None:
+            spec = _PLAN_CACHE.get_similar(scope, vec, signature)
+            if spec is not None:
+                return spec
+        resp = await client.responses.create(**_plan_request(user_question, df, model))
+    spec = _parse_plan(resp.output_text)
+    _PLAN_CACHE.put(scope, user_question, spec, vec, signature)
+    return spec
+
+async def _aplan_many(questions: List[str], df: pd.DataFrame, api_key: str, model: str, concurrency: int):
+    from openai import AsyncOpenAI
+
+    client = AsyncOpenAI(api_key=api_key)
+    sem = asyncio.Semaphore(concurrency)
+    try:
+        return await asyncio.gather(
+            *[_aplan(client, sem, q, df, model) for q in questions], return_exceptions=True
+        )
+    finally:
+        await client.close()
+
+def plan_queries_with_llm(
+    questions: List[str],
+    df: pd.DataFrame,
+    api_key: str,
+    model: str = "gpt-4.1-mini",
+    concurrency: int = 8,
+) -> List[Union[QuerySpec, Exception]]:
+    """
+    Plan many questions against the same frame concurrently (at most `concurrency`
+    requests in flight). Results come back in input order; a failed plan is returned
+    as its exception instead of aborting the others.
+    """
+    return asyncio.run(_aplan_many(questions, df, api_key, model, max(1, concurrency)))
+
+def _as_mask(cond: pd.Series, na: bool = False) -> np.ndarray:
+    """Plain bool ndarray; nullable dtypes' NA cells become `na`."""
+    return cond.to_numpy(dtype=bool, na_value=na)
+
+def _contains_needle(s: pd.Series, val: Any) -> str:
+    # integer columns (e.g. the Int8 Age from cleaning) print as "30": a needle of
+    # 30.0 / "30.0" must still find them, as it did when ages were floats
+    if pd.api.types.is_integer_dtype(s.dtype):
+        try:
+            f = float(val)
+        except (TypeError, ValueError):
+            return str(val)
+        if f.is_integer():
+            return str(int(f))
+    return str(val)
+
+def _contains_mask(s: pd.Series, val: Any) -> np.ndarray:
+    """Case-insensitive literal substring match; missing cells never match."""
+    text = s.astype("string")
+    needle = _contains_needle(s, val)
+    if pc is not None:
+        hits = pc.match_substring(pa.array(text), pattern=needle, ignore_case=True)
+        return pc.fill_null(hits, False).to_numpy(zero_copy_only=False)
+    return _as_mask(text.str.contains(needle, case=False, regex=False, na=False))
+
+def _numeric(s: pd.Series, cache: Dict[str, np.ndarray]) -> np.ndarray:
+    """Column coerced to float (unparseable -> NaN), computed once per column per query."""
+    if s.name not in cache:
+        # numeric dtypes (incl. nullable Int/Float) compare straight from their buffer;
+        # only text/object columns need the parse-or-NaN pass
+        if not pd.api.types.is_numeric_dtype(s.dtype):
+            s = pd.to_numeric(s, errors="coerce")
+        cache[s.name] = s.to_numpy(dtype=float, na_value=np.nan)
+    return cache[s.name]
+
+def _eq(s: pd.Series, val: Any, numeric: Dict[str, np.ndarray]) -> np.ndarray:
+    return _as_mask(s.isna()) if val is None else _as_mask(s == val)
+
+def _neq(s: pd.Series, val: Any, numeric: Dict[str, np.ndarray]) -> np.ndarray:
+    if val is None:
+        return _as_mask(s.notna())
+    # nullable dtypes give NA for missing cells; missing is still "not equal"
+    return _as_mask(s != val, na=True)
+
+def _contains(s: pd.Series, val: Any, numeric: Dict[str, np.ndarray]) -> np.ndarray:
+    return _contains_mask(s, val)
+
+def _in(s: pd.Series, val: Any, numeric: Dict[str, np.ndarray]) -> np.ndarray:
+    return _as_mask(s.isin(val if isinstance(val, list) else [val]))
+
+def _gte(s: pd.Series, val: Any, numeric: Dict[str, np.ndarray]) -> np.ndarray:
+    return _numeric(s, numeric) >= float(val)
+
+def _lte(s: pd.Series, val: Any, numeric: Dict[str, np.ndarray]) -> np.ndarray:
+    return _numeric(s, numeric) <= float(val)
+
+# op -> (series, value, per-query numeric cache) -> bool mask; unknown ops are ignored
+OPS: Dict[str, Callable[[pd.Series, Any, Dict[str, np.ndarray]], np.ndarray]] = {
+    "eq": _eq,
+    "neq": _neq,
+    "contains": _contains,
+    "in": _in,
+    "gte": _gte,
+    "lte": _lte,
+}
 
 def execute_query(spec: QuerySpec, df: pd.DataFrame) -> pd.DataFrame:
-    out = df.copy()
+    # AND every filter into one boolean mask and select rows once at the end,
+    # instead of materializing a new frame per filter
+    mask = np.ones(len(df), dtype=bool)
+    numeric: Dict[str, np.ndarray] = {}
 
     for f in spec.filters:
-        col = f.column
-        if col not in out.columns:
+        op = OPS.get(f.op)
+        if op is None or f.column not in df.columns:
             continue
-        op = f.op
-        val = f.value
-
-        if op == "eq":
-            if val is None:
-               out = out[out[col].isna()]
-            else:
-               out = out[out[col] == val]
-        elif op == "neq":
-            if val is None:
-               out = out[out[col].notna()]
-            else:
-               out = out[out[col] != val]
-        elif op == "contains":
-            out = out[out[col].astype(str).str.contains(str(val), case=False, na=False)]
-        elif op == "in":
-            if not isinstance(val, list):
-                val = [val]
-            out = out[out[col].isin(val)]
-        elif op == "gte":
-            out = out[pd.to_numeric(out[col], errors="coerce") >= float(val)]
-        elif op == "lte":
-            out = out[pd.to_numeric(out[col], errors="coerce") <= float(val)]
+        mask &= op(df[f.column], f.value, numeric)
+        if not mask.any():
+            # nothing left to filter; fall through to build the (empty) projection
+            break
 
+    # project before materializing rows, and take only the first `limit` survivors
+    # in a single positional take instead of drop_duplicates() + head()
     if spec.select:
-        safe_select = [c for c in spec.select if c in out.columns]
-        out = out[safe_select]
+        out = df.loc[mask, [c for c in spec.select if c in df.columns]]
+    else:
+        out = df.loc[mask]
 
-    if spec.distinct:
-        out = out.drop_duplicates()
+    keep = np.arange(len(out))
+    # (drop_duplicates on a zero-column frame keeps every row; match that)
+    if spec.distinct and len(out.columns):
+        keep = np.flatnonzero(~out.duplicated().to_numpy())
 
-    return out.head(spec.limit)
+    return out.iloc[keep[: spec.limit]]
 
 def summarize_results_with_llm(user_question: str, result_df: pd.DataFrame, api_key: str, model: str = "gpt-4.1-mini") -> str:
     client = _openai_client(api_key)
-    safe_df = result_df.copy().where(pd.notna(result_df), None)
-    preview = _json_safe(safe_df.to_dict(orient="records"))
-
-
-    import json  # add at top if not present
+    preview = _records(result_df)
 
     payload = {"question": user_question, "results": preview}
 
@@ -146,7 +433,7 @@ def summarize_results_with_llm(user_question: str, result_df: pd.DataFrame, api_
     model=model,
     input=[
         {"role": "system", "content": "You are a helpful analyst. Summarize results concisely and accurately."},
-        {"role": "user", "content": json.dumps(payload)},
+        {"role": "user", "content": _dumps(payload)},
     ],
     temperature=0.2,
     max_output_tokens=500,
@@ -3,6 +3,11 @@ from __future__ import annotations
 import re
 from typing import Tuple
 
+try:
+    import re2  # google-re2: linear-time DFA matching, optional
+except ImportError:
+    re2 = None
+
 INJECTION_PATTERNS = [
     r"ignore (all|any) previous",
     r"system prompt",
@@ -11,9 +16,18 @@ INJECTION_PATTERNS = [
     r"prompt injection",
 ]
 
+_INJECTION_ALTERNATION = "(" + ")|(".join(INJECTION_PATTERNS) + ")"
+
+# one pre-compiled alternation: a single scan per check, and case-insensitive matching instead of a
+# .lower() copy. RE2 (when installed) guarantees linear time regardless of input; `re` is the fallback.
+if re2 is not None:
+    _INJECTION_RE = re2.compile("(?i)" + _INJECTION_ALTERNATION)
+else:
+    _INJECTION_RE = re.compile(_INJECTION_ALTERNATION, re.IGNORECASE)
+
+INJECTION_MESSAGE = "That request looks like a prompt-injection attempt. I can only answer questions about the uploaded dataset."
+
 def basic_injection_check(user_text: str) -> Tuple[bool, str]:
-    t = (user_text or "").lower()
-    for pat in INJECTION_PATTERNS:
-        if re.search(pat, t):
-            return True, "That request looks like a prompt-injection attempt. I can only answer questions about the uploaded dataset."
+    if _INJECTION_RE.search(user_text or ""):
+        return True, INJECTION_MESSAGE
     return False, ""
@@ -6,6 +6,7 @@ Usage:
     python -m src.eval.run_agent_suite
 """
 
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import json
 import os
@@ -16,6 +17,21 @@ from src.agent.graph import run_agent
 TEST_DIR = Path("test_inputs")
 MODEL = "gpt-4.1-mini"
 MAX_ATTEMPTS = 4
+MAX_WORKERS = 8  # cases are independent and network-bound, so threads are enough
+
+
+def _list_inputs(test_dir: Path):
+    """Sorted *.txt files in test_dir (one scandir pass, no glob/fnmatch per entry)."""
+    if not test_dir.is_dir():
+        return []
+    with os.scandir(test_dir) as it:
+        return sorted(Path(e.path) for e in it if e.name.endswith(".txt") and e.is_file())
+
+
+def _read_input(path: Path) -> str:
+    # a stray non-UTF-8 byte in a fixture shouldn't crash the whole suite
+    with open(path, "rb") as f:
+        return f.read().decode("utf-8", "replace")
 
 
 def main():
@@ -26,7 +42,7 @@ def main():
             "export OPENAI_API_KEY=\"sk-...\""
         )
 
-    inputs = sorted(TEST_DIR.glob("*.txt"))
+    inputs = _list_inputs(TEST_DIR)
     if not inputs:
         raise SystemExit("No test_inputs/*.txt files found. Create the sample inputs first.")
 
@@ -46,63 +62,69 @@ def main():
         # "case15_extreme_noise.txt": "reject",
     }
 
-    for p in inputs:
-        total += 1
-        raw = p.read_text()
-        print(f"\n=== Running: {p.name} ===")
-        try:
-            final = run_agent(raw, api_key=api_key, model=MODEL, max_attempts=MAX_ATTEMPTS)
-        except Exception as e:
-            print(f"[ERROR] agent crashed for {p.name}: {e}")
-            continue
-
-        result = final.get("result")
-        log = final.get("log", [])
-
-        # attempts used is the max attempt number seen in log, fall back to 0
-        attempts_used = max((entry.get("attempt", 0) for entry in log), default=0)
-
-        employees_n = 0
-        rejected_n = 0
-        if result:
-            employees_n = len(result.get("employees", []))
-            rejected_n = len(result.get("rejected", []))
-
-        # Define pass = result is not None (valid schema produced)
-        passed = result is not None
-
-        # Print a concise line
-        print(f"{p.name}: {'PASS' if passed else 'FAIL'} | attempts={attempts_used} | employees={employees_n} | rejected={rejected_n}")
-
-        # Print extra info for failures or suspicious cases
-        if not passed:
-            print("-> Agent failed to produce schema-valid JSON within retry limit.")
-            print("Last JSON attempt:")
-            print(final.get("last_json_text", ""))
-        else:
-            # Optionally print the JSON for inspection of suspicious cases
-            if employees_n == 0 and rejected_n > 0:
-                print("-> No valid employees extracted; records were rejected (no hallucination).")
-            # You can uncomment to always show the JSON
-            # print(json.dumps(result, indent=2))
-
-        # Evaluate "correct handling" heuristically:
-        # if expected_outcomes says "reject" and the agent indeed rejected (employees==0 and rejected>0) -> correct
-        expected = expected_outcomes.get(p.name)
-        handled_correctly = False
-        if expected == "reject":
-            handled_correctly = (employees_n == 0 and rejected_n > 0)
-        else:
-            # default heuristic: producing a schema result is considered handling (but inspect counts)
-            handled_correctly = passed
-
-        if handled_correctly:
-            correct_handling += 1
-
-        if passed:
-            passed_count += 1
-            attempts_hist_for_passed.append(attempts_used)
-        attempts_hist.append(attempts_used)
+    # run every case concurrently, but report in input order so the output stays deterministic
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as ex:
+        futures = [
+            ex.submit(run_agent, _read_input(p), api_key=api_key, model=MODEL, max_attempts=MAX_ATTEMPTS)
+            for p in inputs
+        ]
+
+        for p, fut in zip(inputs, futures):
+            total += 1
+            print(f"\n=== Running: {p.name} ===")
+            try:
+                final = fut.result()
+            except Exception as e:
+                print(f"[ERROR] agent crashed for {p.name}: {e}")
+                continue
+
+            result = final.get("result")
+            log = final.get("log", [])
+
+            # attempts used is the max attempt number seen in log, fall back to 0
+            attempts_used = max((entry.get("attempt", 0) for entry in log), default=0)
+
+            employees_n = 0
+            rejected_n = 0
+            if result:
+                employees_n = len(result.get("employees", []))
+                rejected_n = len(result.get("rejected", []))
+
+            # Define pass = result is not None (valid schema produced)
+            passed = result is not None
+
+            # Print a concise line
+            print(f"{p.name}: {'PASS' if passed else 'FAIL'} | attempts={attempts_used} | employees={employees_n} | rejected={rejected_n}")
+
+            # Print extra info for failures or suspicious cases
+            if not passed:
+                print("-> Agent failed to produce schema-valid JSON within retry limit.")
+                print("Last JSON attempt:")
+                print(final.get("last_json_text", ""))
+            else:
+                # Optionally print the JSON for inspection of suspicious cases
+                if employees_n == 0 and rejected_n > 0:
+                    print("-> No valid employees extracted; records were rejected (no hallucination).")
+                # You can uncomment to always show the JSON
+                # print(json.dumps(result, indent=2))
+
+            # Evaluate "correct handling" heuristically:
+            # if expected_outcomes says "reject" and the agent indeed rejected (employees==0 and rejected>0) -> correct
+            expected = expected_outcomes.get(p.name)
+            handled_correctly = False
+            if expected == "reject":
+                handled_correctly = (employees_n == 0 and rejected_n > 0)
+            else:
+                # default heuristic: producing a schema result is considered handling (but inspect counts)
+                handled_correctly = passed
+
+            if handled_correctly:
+                correct_handling += 1
+
+            if passed:
+                passed_count += 1
+                attempts_hist_for_passed.append(attempts_used)
+            attempts_hist.append(attempts_used)
 
     # Summary
     print("\n=== SUITE SUMMARY ===")
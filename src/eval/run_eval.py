@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import argparse
+import hashlib
 import json
 import os
 from dataclasses import dataclass
@@ -10,7 +11,7 @@ from typing import Any, Dict, List, Optional, Tuple
 import pandas as pd
 
 from src.core.cleaning import clean_dataframe
-from src.core.query import QuerySpec, FilterSpec, execute_query, plan_query_with_llm
+from src.core.query import QuerySpec, FilterSpec, execute_query, plan_queries_with_llm
 
 
 @dataclass
@@ -38,13 +39,15 @@ def _check_expected(result_df: pd.DataFrame, expected: Dict[str, Any]) -> Tuple[
     et = expected.get("type")
     if et == "set_equals":
         col = expected["column"]
-        want = set(expected["values"])
+        want = frozenset(map(str, expected["values"]))
         if col not in result_df.columns:
             return False, f"Missing expected column '{col}'. Columns: {list(result_df.columns)}"
-        got = set([x for x in result_df[col].dropna().astype(str).tolist()])
-        missing = want - got
-        extra = got - want
-        if missing or extra:
+        # dedupe in pandas first so only distinct values are stringified into Python
+        got = frozenset(result_df[col].dropna().drop_duplicates().astype(str))
+        diff = want.symmetric_difference(got)
+        if diff:
+            missing = diff & want
+            extra = diff - want
             return False, f"Set mismatch. Missing={sorted(missing)} Extra={sorted(extra)}"
         return True, "OK"
     if et == "row_count_gte":
@@ -58,12 +61,37 @@ def _check_expected(result_df: pd.DataFrame, expected: Dict[str, Any]) -> Tuple[
     return False, f"Unknown expected.type '{et}'"
 
 
+def _categorize_low_cardinality(df: pd.DataFrame, max_ratio: float = 0.5) -> pd.DataFrame:
+    """Store repetitive text columns as categoricals so eq/in filters compare integer codes."""
+    for col in df.columns:
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype) or not pd.api.types.is_string_dtype(s.dtype):
+            continue
+        if len(s) and s.nunique() / len(s) < max_ratio:
+            df[col] = s.astype("category")
+    return df
+
+
 def run(args: argparse.Namespace) -> int:
     bench = _load_benchmarks(Path(args.benchmarks))
     df_raw = pd.read_csv(args.csv)
     df, report = clean_dataframe(df_raw)
+    df = _categorize_low_cardinality(df)
+
+    api_key = args.api_key or os.getenv("OPENAI_API_KEY", "")
+
+    # plan every llm-mode case up front, concurrently, instead of one round-trip per loop iteration
+    llm_cases = [c for c in bench["cases"] if c.get("mode", "spec") == "llm"]
+    planned: Dict[str, Any] = {}
+    if llm_cases and api_key:
+        specs = plan_queries_with_llm(
+            [c["question"] for c in llm_cases], df, api_key=api_key, model=args.model, concurrency=args.concurrency
+        )
+        planned = {c["id"]: s for c, s in zip(llm_cases, specs)}
 
     results: List[CaseResult] = []
+    # several cases often check different expectations against the same query
+    query_cache: Dict[bytes, pd.DataFrame] = {}
 
     for case in bench["cases"]:
         cid = case["id"]
@@ -74,16 +102,20 @@ def run(args: argparse.Namespace) -> int:
             if mode == "spec":
                 spec = _spec_from_dict(case["spec"])
             elif mode == "llm":
-                if not args.api_key and not os.getenv("OPENAI_API_KEY"):
+                if not api_key:
                     results.append(CaseResult(cid, False, "No API key for LLM mode"))
                     continue
-                api_key = args.api_key or os.getenv("OPENAI_API_KEY", "")
-                spec = plan_query_with_llm(case["question"], df, api_key=api_key, model=args.model)
+                spec = planned[cid]
+                if isinstance(spec, Exception):
+                    raise spec
             else:
                 results.append(CaseResult(cid, False, f"Unknown mode '{mode}'"))
                 continue
 
-            out = execute_query(spec, df)
+            key = hashlib.blake2b(spec.model_dump_json().encode("utf-8"), digest_size=16).digest()
+            if key not in query_cache:
+                query_cache[key] = execute_query(spec, df)
+            out = query_cache[key]
             ok, details = _check_expected(out, expected)
             results.append(CaseResult(cid, ok, details))
         except Exception as e:
@@ -110,4 +142,5 @@ if __name__ == "__main__":
     p.add_argument("--benchmarks", default="src/eval/benchmarks.json", help="Path to benchmarks.json")
     p.add_argument("--api-key", default="", help="OpenAI API key (optional; only needed for llm-mode cases)")
     p.add_argument("--model", default="gpt-4.1-mini", help="Model for llm-mode cases")
+    p.add_argument("--concurrency", type=int, default=8, help="Max in-flight planning requests for llm-mode cases")
     raise SystemExit(run(p.parse_args()))
@@ -0,0 +1,22 @@
+import pandas as pd
+from src.core.cleaning import clean_dataframe
+
+def test_clean_dataframe_normalizes_messy_columns():
+    df = pd.DataFrame([
+        {"Age": "twenty nine", "Email": "michael at gmail.com", "Salary": "$120,000", "Department": "ai", "Location": "nyc"},
+        {"Age": "thirty-two", "Email": " ", "Salary": "88000", "Department": "Data  Science", "Location": "Seatle"},
+    ])
+    out, report = clean_dataframe(df)
+    assert out["Age"].tolist() == [29, 32]
+    assert out["Email"].tolist() == ["michael@gmail.com", "unknown@unknown.com"]
+    assert out["Salary"].tolist() == [120000.0, 88000.0]
+    assert out["Department"].tolist() == ["Artificial Intelligence", "Data Science"]
+    assert out["Location"].tolist() == ["New York", "Seattle"]
+    assert report.fixes["email_cleaned"] == 2
+    assert report.fixes["salary_cleaned"] == 1
+
+def test_missing_value_left_missing_is_not_counted_as_fix():
+    df = pd.DataFrame({"Name": ["  ann lee", None], "Age": ["twenty", None]})
+    _, report = clean_dataframe(df)
+    assert report.fixes["name_normalized"] == 1
+    assert report.fixes["age_parsed"] == 1
@@ -9,3 +9,93 @@ def test_execute_query_eq():
     spec = QuerySpec(select=["Name"], filters=[FilterSpec(column="Department", op="eq", value="Artificial Intelligence")])
     out = execute_query(spec, df)
     assert out["Name"].tolist() == ["A"]
+
+def test_execute_query_contains_is_literal_and_case_insensitive():
+    df = pd.DataFrame({"Email": ["ann@x.com", "BOB@TechCorp.com", None, "carl"]})
+    spec = QuerySpec(filters=[FilterSpec(column="Email", op="contains", value=".")])
+    assert execute_query(spec, df)["Email"].tolist() == ["ann@x.com", "BOB@TechCorp.com"]
+    spec = QuerySpec(filters=[FilterSpec(column="Email", op="contains", value="techcorp")])
+    assert execute_query(spec, df)["Email"].tolist() == ["BOB@TechCorp.com"]
+
+def test_execute_query_contains_float_needle_on_int_column():
+    df = pd.DataFrame({"Name": ["A", "B", "C"], "Age": pd.array([30, 31, None], dtype="Int8")})
+    for needle in (30.0, "30.0", 30):
+        spec = QuerySpec(filters=[FilterSpec(column="Age", op="contains", value=needle)])
+        assert execute_query(spec, df)["Name"].tolist() == ["A"]
+
+def test_execute_query_neq_keeps_missing_rows_on_nullable_dtypes():
+    df = pd.DataFrame({
+        "Name": ["A", "B", "C"],
+        "Dept": pd.array(["AI", None, "DS"], dtype="string"),
+        "Age": pd.array([30, None, 40], dtype="Int8"),
+    })
+    spec = QuerySpec(filters=[FilterSpec(column="Dept", op="neq", value="AI")])
+    assert execute_query(spec, df)["Name"].tolist() == ["B", "C"]
+    spec = QuerySpec(filters=[FilterSpec(column="Age", op="neq", value=30)])
+    assert execute_query(spec, df)["Name"].tolist() == ["B", "C"]
+
+def test_execute_query_gte_lte_on_nullable_int():
+    df = pd.DataFrame({"Name": ["A", "B", "C", "D"], "Age": pd.array([25, None, 35, 45], dtype="Int8")})
+    spec = QuerySpec(filters=[
+        FilterSpec(column="Age", op="gte", value=30),
+        FilterSpec(column="Age", op="lte", value="40"),
+    ])
+    assert execute_query(spec, df)["Name"].tolist() == ["C"]
+
+def test_execute_query_distinct_limit_keeps_first_occurrence_order():
+    df = pd.DataFrame({
+        "Dept": ["DS", "AI", "DS", "ML", "AI", "BI"],
+        "Name": ["a", "b", "c", "d", "e", "f"],
+    })
+    out = execute_query(QuerySpec(select=["Dept"], distinct=True, limit=3), df)
+    assert out["Dept"].tolist() == ["DS", "AI", "ML"]
+    assert out.index.tolist() == [0, 1, 3]
+    out = execute_query(QuerySpec(select=["Dept"], distinct=False, limit=3), df)
+    assert out["Dept"].tolist() == ["DS", "AI", "DS"]
+
+def test_execute_query_stops_filtering_once_nothing_matches():
+    df = pd.DataFrame({"Name": ["A", "B"], "Dept": ["AI", "DS"]})
+    spec = QuerySpec(select=["Name"], filters=[
+        FilterSpec(column="Dept", op="eq", value="Nope"),
+        # would raise if evaluated: float("not a number")
+        FilterSpec(column="Dept", op="gte", value="not a number"),
+    ])
+    out = execute_query(spec, df)
+    assert out.empty and out.columns.tolist() == ["Name"]
+
+def test_plan_cache_reuses_paraphrase_but_not_different_numbers(monkeypatch):
+    from types import SimpleNamespace
+    from src.core import query
+
+    vectors = {"ai people": [1.0, 0.0], "people in ai": [0.99, 0.05], "salary over 100": [0.0, 1.0], "salary over 90": [0.0, 1.0]}
+    calls = []
+    client = SimpleNamespace(
+        embeddings=SimpleNamespace(create=lambda model, input: SimpleNamespace(data=[SimpleNamespace(embedding=vectors[input])])),
+        responses=SimpleNamespace(create=lambda **kw: calls.append(kw) or SimpleNamespace(output_text='{"select": ["Name"]}')),
+    )
+    monkeypatch.setattr(query, "_openai_client", lambda api_key: client)
+    monkeypatch.setattr(query, "_PLAN_CACHE", query.PlanCache())
+    df = pd.DataFrame([{"Name": "A", "Salary": 100}])
+
+    for q in ["ai people", "AI  people", "people in ai", "salary over 100", "salary over 90"]:
+        assert query.plan_query_with_llm(q, df, api_key="k").select == ["Name"]
+    assert len(calls) == 3
+
+
+def test_plan_cache_does_not_reuse_plan_across_negation_or_other_category(monkeypatch):
+    from types import SimpleNamespace
+    from src.core import query
+
+    # identical embeddings: only the question signature can keep these apart
+    calls = []
+    client = SimpleNamespace(
+        embeddings=SimpleNamespace(create=lambda model, input: SimpleNamespace(data=[SimpleNamespace(embedding=[1.0, 0.0])])),
+        responses=SimpleNamespace(create=lambda **kw: calls.append(kw) or SimpleNamespace(output_text='{"select": ["Name"]}')),
+    )
+    monkeypatch.setattr(query, "_openai_client", lambda api_key: client)
+    monkeypatch.setattr(query, "_PLAN_CACHE", query.PlanCache())
+    df = pd.DataFrame({"Name": ["A", "B"], "Department": ["Data Science", "Machine Learning"]})
+
+    for q in ["names in Data Science", "names not in Data Science", "names in Machine Learning", "Data Science names"]:
+        query.plan_query_with_llm(q, df, api_key="k")
+    assert len(calls) == 3
@@ -0,0 +1,170 @@
+import json
+from types import SimpleNamespace
+
+from src.agent import graph
+from src.agent.llm_cache import LLMCache
+
+VALID = json.dumps({
+    "employees": [{"user_id": 101, "name": "michael chen", "department": "Artificial Intelligence"}],
+    "rejected": [],
+})
+
+
+class _FakeAsyncClient:
+    def __init__(self, outputs):
+        self.outputs = list(outputs)
+        self.responses = SimpleNamespace(create=self._create)
+
+    async def _create(self, **kwargs):
+        return SimpleNamespace(output_text=self.outputs.pop(0))
+
+    async def close(self):
+        pass
+
+
+def test_run_agent_many_retries_until_valid(monkeypatch):
+    monkeypatch.setattr(graph, "get_llm_cache", lambda: LLMCache(":memory:"))
+    monkeypatch.setattr(graph, "_async_openai_client", lambda api_key: _FakeAsyncClient(["not json", VALID]))
+
+    [state] = graph.run_agent_many(["ID: 101 Name: michael chen Dept: ai"], api_key="k", max_attempts=3)
+
+    assert state["result"]["employees"][0]["name"] == "Michael Chen"
+    assert state["attempt"] == 2
+    assert [e["step"] for e in state["log"]] == ["extract", "validate", "correct", "validate"]
+    assert graph.expand_log(state)[2]["output"] == VALID
+
+
+def test_split_records_one_chunk_per_id():
+    raw = "Employee 1:\nID: 201\nName: a\n\nEmployee 2:\nID: 202\nName: b"
+    assert graph._split_records(raw) == ["Employee 1:\nID: 201\nName: a", "Employee 2:\nID: 202\nName: b"]
+    assert graph._split_records("ID: 1\n\nName: a") == ["ID: 1\n\nName: a"]
+
+
+def test_validate_auto_repairs_trivial_errors_without_llm():
+    messy = json.dumps({
+        "employees": [{
+            "user_id": 101, "name": "michael chen", "department": "ai",
+            "age": "", "performance_score": 11,
+        }],
+        "rejected": [],
+    })
+    state = graph._initial_state("raw", max_attempts=3)
+    state["last_json_text"] = messy
+
+    state = graph._validate(state)
+
+    emp = state["result"]["employees"][0]
+    assert emp["department"] == "Artificial Intelligence"
+    assert emp["age"] is None and emp["performance_score"] is None
+    assert [e["step"] for e in state["log"]] == ["repair", "validate"]
+
+
+def test_auto_repair_never_fills_missing_user_id():
+    state = graph._initial_state("raw", max_attempts=3)
+    state["last_json_text"] = json.dumps({"employees": [{"name": "a", "department": "ai"}]})
+
+    state = graph._validate(state)
+
+    assert state["result"] is None
+    assert graph._should_retry(state) == "retry"
+
+
+def test_stream_agent_yields_each_step(monkeypatch):
+    monkeypatch.setattr(graph, "get_llm_cache", lambda: LLMCache(":memory:"))
+    monkeypatch.setattr(graph, "_cached_llm_call", lambda *args, **kwargs: (VALID, False))
+
+    steps = list(graph.stream_agent("ID: 101 Name: michael chen Dept: ai", api_key="k"))
+
+    assert [node for node, _ in steps] == ["extract", "validate"]
+    assert steps[-1][1]["result"]["employees"][0]["user_id"] == 101
+
+
+def test_learned_template_skips_llm_for_same_input_shape(monkeypatch):
+    cache = LLMCache(":memory:")
+    monkeypatch.setattr(graph, "get_llm_cache", lambda: cache)
+    monkeypatch.setattr(graph, "_cached_llm_call", lambda *args, **kwargs: (VALID, False))
+    graph.run_agent("ID: 101\nName: michael chen\nDept: ai", api_key="k")
+
+    def _no_llm(*args, **kwargs):
+        raise AssertionError("LLM should not be called")
+
+    monkeypatch.setattr(graph, "_cached_llm_call", _no_llm)
+    state = graph.run_agent("ID: 102\nName: maria lopez\nDept: Data Science", api_key="k")
+
+    assert state["log"][0]["cache"] == "template"
+    assert state["result"]["employees"][0]["user_id"] == 102
+    assert state["result"]["employees"][0]["department"] == "Data Science"
+
+
+def test_template_falls_back_to_llm_when_a_value_does_not_parse(monkeypatch):
+    cache = LLMCache(":memory:")
+    monkeypatch.setattr(graph, "get_llm_cache", lambda: cache)
+    learned = json.dumps({
+        "employees": [{
+            "user_id": 102, "name": "maria lopez", "age": 32, "email": "maria@gmail.com",
+            "salary": 120000, "department": "ai", "performance_score": 9,
+        }],
+        "rejected": [],
+    })
+    monkeypatch.setattr(graph, "_cached_llm_call", lambda *args, **kwargs: (learned, False))
+    with open("test_inputs/case02_word_numbers.txt") as f:
+        graph.run_agent(f.read(), api_key="k")
+    assert any(k.startswith("template:") for (k,) in cache._conn.execute("SELECT key FROM responses"))
+
+    calls = []
+    monkeypatch.setattr(graph, "_cached_llm_call", lambda *args, **kwargs: calls.append(1) or (VALID, False))
+    raw = "ID: 110\nName: ann lee\nAge: 29 years\nDept: ai\nSalary: 95k\nPerformance: 8/10\nEmail: ann@x.com"
+    state = graph.run_agent(raw, api_key="k")
+
+    assert calls and state["log"][0].get("cache") != "template"
+
+
+def _learn_then_count_llm_calls(monkeypatch, learn_raw, learned, raw, model="gpt-4.1-mini"):
+    cache = LLMCache(":memory:")
+    monkeypatch.setattr(graph, "get_llm_cache", lambda: cache)
+    monkeypatch.setattr(graph, "_cached_llm_call", lambda *args, **kwargs: (learned, False))
+    graph.run_agent(learn_raw, api_key="k")
+    assert any(k.startswith("template:") for (k,) in cache._conn.execute("SELECT key FROM responses"))
+
+    calls = []
+    monkeypatch.setattr(graph, "_cached_llm_call", lambda *args, **kwargs: calls.append(1) or (VALID, False))
+    graph.run_agent(raw, api_key="k", model=model)
+    return len(calls)
+
+
+def test_template_never_guesses_partial_or_fuzzy_dates(monkeypatch):
+    with open("test_inputs/case05_weird_date.txt") as f:
+        learn_raw = f.read()
+    learned = json.dumps({
+        "employees": [{
+            "user_id": 105, "name": "David Chen", "age": 29, "salary": 99000, "join_date": "2024-02-14",
+            "department": "AI/ML", "performance_score": 7.8,
+        }],
+        "rejected": [],
+    })
+    for join in ["early 2023", "Q3 2023", "March 2023"]:
+        raw = learn_raw.replace("14th Feb 2024", join).replace("105", "106")
+        assert _learn_then_count_llm_calls(monkeypatch, learn_raw, learned, raw) == 1, join
+    raw = learn_raw.replace("14th Feb 2024", "3rd March 2023").replace("105", "106")
+    assert _learn_then_count_llm_calls(monkeypatch, learn_raw, learned, raw) == 0
+
+
+def test_template_skipped_for_free_text_or_other_model(monkeypatch):
+    learn_raw = "ID: 101\nName: michael chen\nDept: ai"
+    raw = (
+        "ID: 102\nName: bob ray\nDept: ai\n"
+        "He earns $150,000 per year and his email is bob@x.com, performance 9, based in Boston"
+    )
+    assert _learn_then_count_llm_calls(monkeypatch, learn_raw, VALID, raw) == 1
+    assert _learn_then_count_llm_calls(monkeypatch, learn_raw, VALID, "ID: 102\nName: bob ray\nDept: ai", model="gpt-4o") == 1
+
+
+def test_output_budget_grows_with_input_but_stays_within_model_limit():
+    many = "\n\n".join(f"ID: {i}\nName: n{i}\nDept: ai" for i in range(30))
+    assert graph._output_budget(many, graph.CORRECT_MAX_TOKENS, "gpt-4o") == 30 * graph.PER_RECORD_MAX_TOKENS
+    huge = "402, linda jones, thirty, data science, 92000, performance 8\n" * 600
+    assert graph._output_budget(huge, graph.SINGLE_EXTRACT_MAX_TOKENS, "gpt-4o-mini") == 16384
+
+    state = graph._initial_state(huge, max_attempts=3, model="gpt-4o")
+    state["last_json_text"] = "x" * 100_000
+    assert graph._correct_budget(state, "gpt-4o") == 16384
@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+
+from src.agent import graph
+from src.agent.llm_cache import LLMCache
+
+
+class _FakeClient:
+    def __init__(self, text):
+        self.calls = 0
+        self.responses = SimpleNamespace(create=self._create)
+        self._text = text
+
+    def _create(self, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(output_text=self._text)
+
+
+def test_identical_prompt_is_served_from_cache(monkeypatch):
+    client = _FakeClient('{"employees": [], "rejected": []}')
+    cache = LLMCache(":memory:")
+    monkeypatch.setattr(graph, "get_llm_cache", lambda: cache)
+
+    first = graph._cached_llm_call(client, "m", "sys", "user", max_output_tokens=10)
+    second = graph._cached_llm_call(client, "m", "sys", "user", max_output_tokens=10)
+
+    assert first == ('{"employees": [], "rejected": []}', False)
+    assert second == ('{"employees": [], "rejected": []}', True)
+    assert client.calls == 1
+
+
+def test_unparseable_response_is_not_cached(monkeypatch):
+    client = _FakeClient("")
+    cache = LLMCache(":memory:")
+    monkeypatch.setattr(graph, "get_llm_cache", lambda: cache)
+
+    graph._cached_llm_call(client, "m", "sys", "user", max_output_tokens=10)
+    graph._cached_llm_call(client, "m", "sys", "user", max_output_tokens=10)
+
+    assert client.calls == 2